@@ -0,0 +1,109 @@
+# -*- coding: UTF-8 -*-
+"""
+Compare the JSON codecs available in kbg.codec on payloads shaped like the
+API's largest responses: /init (a store's offer) and order details.
+
+    python3 benchmarks/bench_codecs.py
+"""
+import sys
+import timeit
+import random
+from os.path import dirname
+
+sys.path.insert(0, dirname(__file__)+'/..')
+
+from kbg.codec import JSONCodec, available_codecs  # noqa: E402
+
+WORDS = ("bière", "blonde", "ambrée", "pommes", "gala", "jus", "fromage",
+         "chèvre", "frais", "yaourt", "nature", "pain", "complet", "miel",
+         "œufs", "bio", "épinards", "carottes", "brasserie", "ferme")
+
+
+def text(rnd, n):
+    return " ".join(rnd.choice(WORDS) for _ in range(n)).capitalize()
+
+
+def oid(rnd):
+    return "%024x" % rnd.getrandbits(96)
+
+
+def product(rnd, family_ids, producer_ids):
+    return {
+        "_id": oid(rnd),
+        "producerproduct_id": oid(rnd),
+        "product_name": text(rnd, 3),
+        "producer_name": text(rnd, 2),
+        "producer_id": rnd.choice(producer_ids),
+        "family_id": rnd.choice(family_ids),
+        "description": text(rnd, 40),
+        "unit_display": "%d g" % rnd.randint(50, 1000),
+        "consumer_price": rnd.randint(50, 3000),
+        "tva": 5.5,
+        "is_bio": rnd.random() < 0.3,
+        "tags": [rnd.choice(WORDS) for _ in range(3)],
+    }
+
+
+def init_payload(rnd, products=1500):
+    categories = [{"_id": oid(rnd), "name": text(rnd, 2)} for _ in range(10)]
+    families = [{"_id": oid(rnd), "name": text(rnd, 2),
+                 "category_id": rnd.choice(categories)["_id"]}
+                for _ in range(80)]
+    producers = [{"_id": oid(rnd), "name": text(rnd, 2),
+                  "description": text(rnd, 60)} for _ in range(120)]
+
+    family_ids = [f["_id"] for f in families]
+    producer_ids = [p["_id"] for p in producers]
+
+    return {
+        "products": [product(rnd, family_ids, producer_ids)
+                     for _ in range(products)],
+        "categories": categories,
+        "promogroups": [],
+        "families": families,
+        "producers": producers,
+    }
+
+
+def order_payload(rnd, items=30):
+    products = [product(rnd, [oid(rnd)], [oid(rnd)]) for _ in range(items)]
+    return {
+        "order": {
+            "_id": oid(rnd),
+            "locale": "BOR",
+            "createdAt": "2020-04-21T10:00:00.000Z",
+            "items": [{"producerproduct_id": p["producerproduct_id"],
+                       "quantity": rnd.randint(1, 4),
+                       "consumer_price": p["consumer_price"]}
+                      for p in products],
+            "producerproducts": products,
+        }
+    }
+
+
+def main():
+    rnd = random.Random(42)
+    payloads = (
+        ("/init", init_payload(rnd), 20),
+        ("order detail", order_payload(rnd), 500),
+    )
+
+    print("%-14s %-8s %12s %12s" % ("Payload", "Codec", "loads (ms)",
+                                    "dumps (ms)"))
+    for name, payload, number in payloads:
+        # decode the bytes as they come from the network
+        data = JSONCodec().dumps(payload).encode("utf-8")
+
+        for codec in available_codecs():
+            loads = min(timeit.repeat(lambda: codec.loads(data),
+                                      number=number, repeat=3)) / number
+            dumps = min(timeit.repeat(lambda: codec.dumps(payload),
+                                      number=number, repeat=3)) / number
+            print("%-14s %-8s %12.3f %12.3f" % (name, codec.name,
+                                                loads * 1000, dumps * 1000))
+
+        print("%-14s (%d KB)" % ("", len(data) // 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,13 @@
 # -*- coding: UTF-8 -*-
 
-import json
+import threading
+
 import requests
 
+from .codec import get_codec
+from .profiling import NULL_PHASE, Profiler, get_profiler
+from .search import OfferIndex
+
 __version__ = "0.0.5"
 
 API_ENDPOINT = "https://courses-api.kelbongoo.com"
@@ -48,15 +53,146 @@ def _fix_order_fields(order):
     return order
 
 
+class Interner:
+    """
+    Deduplicate the products’ information of order details. Each product’s
+    record is kept once, and orders’ field names are shared. Other per-order
+    values, such as ids and dates, are left alone so that the ``Interner``
+    only grows with the number of distinct products.
+
+    By default, order lines still get their own copy of the record’s fields,
+    but the values (names, descriptions, etc.) are shared. If ``merge`` is
+    false, order lines reference the shared record under a ``"product"`` key
+    instead, which saves the per-line copy.
+
+    Shared records and values must be treated as read-only: with
+    ``merge=False``, the ``"product"`` of all the lines of the same product
+    is the same ``dict``, across all the orders that went through this
+    ``Interner``, so modifying it through one order modifies it in all of
+    them. Copy it first if you need to change it.
+
+    Use one ``Interner`` per client (see ``Kbg``) or per sync (see
+    ``Kbg.get_all_customer_orders``); its memory is released when it is.
+    """
+
+    def __init__(self, merge=True):
+        self.merge = merge
+        self._strings = {}
+        self._records = {}
+
+    def __len__(self):
+        return len(self._strings)
+
+    def intern(self, value):
+        """
+        Return a copy of ``value`` where all strings, including ``dict`` keys,
+        are replaced by their shared version.
+        """
+        if isinstance(value, str):
+            return self._strings.setdefault(value, value)
+        if isinstance(value, dict):
+            return {self.intern(k): self.intern(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.intern(v) for v in value]
+        return value
+
+    def intern_keys(self, d):
+        """
+        Return a copy of the ``dict`` ``d`` with shared keys. Values are left
+        as-is.
+        """
+        return {self.intern(k): v for k, v in d.items()}
+
+    def product_info(self, product_id, info):
+        """
+        Return the shared record for the product ``product_id``. If ``info``
+        differs from the record, e.g. because the product’s description
+        changed, it replaces it for the next calls.
+        """
+        record = self._records.get(product_id)
+        if record is None or record != info:
+            record = self.intern(info)
+            self._records[product_id] = record
+        return record
+
+    def clear(self):
+        """
+        Forget all the shared strings and records.
+        """
+        self._strings.clear()
+        self._records.clear()
+
+
+class OfferCache:
+    """
+    Cache of stores’ offers and their search indexes. Offers don’t depend on
+    the logged-in user, so the same cache can be shared by several clients,
+    including from different threads.
+
+    Cached offers and indexes are read without locking; only refreshes of the
+    same store wait for each other.
+    """
+
+    def __init__(self):
+        self.offers = {}
+        self.indexes = {}
+        # store id -> lock held while the store's offer or index is refreshed
+        self._store_locks = {}
+        self._lock = threading.Lock()
+
+    def store_lock(self, store_id):
+        """
+        Return the lock of the given store.
+        """
+        with self._lock:
+            return self._store_locks.setdefault(store_id, threading.RLock())
+
+
 class UnauthenticatedKbg:
     """
     Simpler version of ``Kbg`` that exposes endpoints which don't need a
     logged-in user.
+
+    If ``session`` is given, it is a ``requests.Session`` used to make all the
+    requests, e.g. to share its connections with other clients.
+
+    ``offer_cache`` is the ``OfferCache`` used by ``get_store_offer`` and
+    ``get_store_index``; pass the same one to several clients to share it.
+
+    ``codec`` is the JSON codec used to encode requests and decode responses.
+    It defaults to the standard library’s ``json``; see
+    ``kbg.codec.get_codec`` to use a faster one.
+
+    If ``profile`` is true, measure the time spent in each public method; the
+    results are available in the ``profiler`` attribute. ``profile`` can also
+    be a ``Profiler`` to share it with other clients. By default, profiling is
+    enabled by the ``KBG_PROFILE`` environment variable; see
+    ``kbg.profiling.get_profiler``.
     """
 
-    def __init__(self):
+    def __init__(self, session=None, profile=None, codec=None,
+                 offer_cache=None):
+        self._session = session
+        self._codec = get_codec(codec)
         self._token = None
-        self._store_offers = {}
+        self._offer_cache = offer_cache or OfferCache()
+
+        self.profiler = get_profiler(profile)
+        if self.profiler is not None:
+            self._profile_methods()
+
+    def _profile_methods(self):
+        for name in dir(type(self)):
+            if name.startswith("_"):
+                continue
+            method = getattr(self, name)
+            if callable(method):
+                setattr(self, name, self.profiler.wrap(name, method))
+
+    def _phase(self, name):
+        if self.profiler is None:
+            return NULL_PHASE
+        return self.profiler.phase(name)
 
     def _request_json(self, path, **kwargs):
         headers = {}
@@ -72,12 +208,17 @@ class UnauthenticatedKbg:
             kwargs["headers"].setdefault("Authorization",
                                          "Bearer %s" % self._token)
 
-        r = requests.request(**kwargs)
-        r.raise_for_status()
-        return r.json()
+        with self._phase("network"):
+            r = (self._session or requests).request(**kwargs)
+            r.raise_for_status()
+
+        with self._phase("decode"):
+            # decode the raw bytes rather than r.text to skip the
+            # intermediate str
+            return self._codec.loads(r.content)
 
     def _post_json(self, path, data):
-        return self._request_json(path, data=json.dumps(data))
+        return self._request_json(path, data=self._codec.dumps(data))
 
     def logged_in(self):
         """
@@ -133,21 +274,35 @@ class UnauthenticatedKbg:
         The ``id`` key can also be used to get the product’s availability using
         ``get_store_availabilities``.
         """
-        if force or store_id not in self._store_offers:
+        cache = self._offer_cache
+        offer = cache.offers.get(store_id)
+        if offer is not None and not force:
+            return offer
+
+        with cache.store_lock(store_id):
+            # another thread may have fetched it while we were waiting
+            offer = cache.offers.get(store_id)
+            if offer is not None and not force:
+                return offer
+
             resp = self._request_json("/init", params={"locale": store_id})
             offer = {}
-            for k in ("products", "categories", "promogroups", "families",
-                      "producers"):
-                items = resp[k]
+            with self._phase("normalize"):
+                for k in ("products", "categories", "promogroups", "families",
+                          "producers"):
+                    items = resp[k]
+
+                    if k == "products":
+                        items = [_fix_product_fields(p) for p in items]
 
-                if k == "products":
-                    items = [_fix_product_fields(p) for p in items]
+                    offer[k] = _strip_mongodb_ids(items)
 
-                offer[k] = _strip_mongodb_ids(items)
+            if store_id in cache.indexes:
+                cache.indexes[store_id].update(offer)
 
-            self._store_offers[store_id] = offer
+            cache.offers[store_id] = offer
 
-        return self._store_offers[store_id]
+        return offer
 
     def get_store_offer_dicts(self, store_id, force=False):
         """
@@ -155,10 +310,29 @@ class UnauthenticatedKbg:
         items by their id.
         """
         offer = self.get_store_offer(store_id, force=force)
-        for k, items in offer.items():
-            offer[k] = {item["id"]: item for item in items}
+        # don't modify the cached offer, which may be shared
+        with self._phase("normalize"):
+            return {k: {item["id"]: item for item in items}
+                    for k, items in offer.items()}
 
-        return offer
+    def get_store_index(self, store_id, force=False):
+        """
+        Return an ``OfferIndex`` to search products in the current offer of the
+        given store. The index is built on the first call and updated
+        incrementally whenever the offer is refreshed with ``force=True``.
+        """
+        cache = self._offer_cache
+        index = cache.indexes.get(store_id)
+        if index is not None and not force:
+            return index
+
+        with cache.store_lock(store_id):
+            # a forced refresh updates the existing index
+            offer = self.get_store_offer(store_id, force=force)
+            if store_id not in cache.indexes:
+                cache.indexes[store_id] = OfferIndex(offer)
+
+            return cache.indexes[store_id]
 
     def get_store_status(self, store_id):
         """
@@ -192,9 +366,17 @@ class UnauthenticatedKbg:
 class Kbg(UnauthenticatedKbg):
     """
     Represent a connection to Kelbongoo’s website.
+
+    If ``interner`` is given, it is used by default to deduplicate the data of
+    all orders returned by ``get_customer_order``; see ``Interner``.
+    ``session``, ``profile``, ``codec`` and ``offer_cache`` are passed to
+    ``UnauthenticatedKbg``.
     """
-    def __init__(self, email, password):
-        super().__init__()
+    def __init__(self, email, password, interner=None, session=None,
+                 profile=None, codec=None, offer_cache=None):
+        super().__init__(session=session, profile=profile, codec=codec,
+                         offer_cache=offer_cache)
+        self._interner = interner
         self._login(email, password)
 
     def _login(self, email, password):
@@ -230,8 +412,9 @@ class Kbg(UnauthenticatedKbg):
 
         orders = resp["items"]
 
-        for order in orders:
-            order = _fix_order_fields(order)
+        with self._phase("normalize"):
+            for order in orders:
+                order = _fix_order_fields(order)
 
         next_page = None
         if orders:
@@ -246,40 +429,60 @@ class Kbg(UnauthenticatedKbg):
             "next_page": next_page,
         }
 
-    def get_all_customer_orders(self, full=False):
+    def get_all_customer_orders(self, full=False, interner=None):
         """
         Generator of all the logged-in customer’s orders.
         If ``full`` is ``True``, make another call to get each order’s full
-        information (see ``get_customer_orders()``).
+        information (see ``get_customer_orders()``). ``interner`` is then
+        passed to ``get_customer_order``.
         """
         page = 1
         while page:
             orders_resp = self.get_customer_orders(page=page)
             for order in orders_resp["orders"]:
                 if full:
-                    order = self.get_customer_order(order["id"])
+                    order = self.get_customer_order(order["id"],
+                                                    interner=interner)
                 yield order
             page = orders_resp["next_page"]
 
-    def get_customer_order(self, order_id):
+    def get_customer_order(self, order_id, interner=None):
         """
         Get more details about an order, including product names and dates when
         the order was created, retrieved, paid for.
+
+        If ``interner`` is given (or was given to the constructor), use it to
+        share products’ information and strings with other orders.
         """
+        if interner is None:
+            interner = self._interner
+
         resp = self._request_json("/api/orders/fetch-detail",
                                   # Not sure what this getPayments does
                                   params={"order_id": order_id,
                                           "getPayments": "true"})
-        order = _fix_order_fields(resp["order"])
-        products_infos = {}
-        for product_info in order.pop("producerproducts"):
-            product_info = _strip_mongodb_id(product_info)
-            pid = product_info["id"]
-            del product_info["id"]
-            products_infos[pid] = product_info
-
-        for product in order["products"]:
-            product = _strip_mongodb_id(product)
-            product.update(products_infos[product["id"]])
+        with self._phase("normalize"):
+            order = _fix_order_fields(resp["order"])
+            products_infos = {}
+            for product_info in order.pop("producerproducts"):
+                product_info = _strip_mongodb_id(product_info)
+                pid = product_info["id"]
+                del product_info["id"]
+                if interner is not None:
+                    product_info = interner.product_info(pid, product_info)
+                products_infos[pid] = product_info
+
+            if interner is not None:
+                order = interner.intern_keys(order)
+                order["products"] = [interner.intern_keys(p)
+                                     for p in order["products"]]
+
+            for product in order["products"]:
+                product = _strip_mongodb_id(product)
+                product_info = products_infos[product["id"]]
+                if interner is not None and not interner.merge:
+                    product["product"] = product_info
+                else:
+                    product.update(product_info)
 
         return order
@@ -0,0 +1,106 @@
+# -*- coding: UTF-8 -*-
+
+"""
+JSON codecs used by clients to encode requests and decode responses.
+"""
+
+import sys
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+
+
+class JSONCodec:
+    """
+    Codec using the standard library’s ``json`` module. It’s always available.
+
+    A codec has a ``dumps`` method that encodes an object as ``str`` or
+    ``bytes``, and a ``loads`` method that decodes UTF-8 ``bytes``.
+    """
+    name = "json"
+
+    def dumps(self, obj):
+        return json.dumps(obj)
+
+    def loads(self, data):
+        # json.loads accepts bytes since Python 3.6
+        if sys.version_info < (3, 6):  # pragma: no cover
+            data = data.decode("utf-8")
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    """
+    Codec using ``orjson``, if it’s installed.
+    """
+    name = "orjson"
+
+    def dumps(self, obj):
+        return orjson.dumps(obj)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class UjsonCodec(JSONCodec):
+    """
+    Codec using ``ujson``, if it’s installed.
+    """
+    name = "ujson"
+
+    def dumps(self, obj):
+        return ujson.dumps(obj)
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+
+# Fastest first
+CODECS = (
+    (OrjsonCodec, orjson),
+    (UjsonCodec, ujson),
+    (JSONCodec, json),
+)
+
+
+def available_codecs():
+    """
+    Return a list of the codecs that can be used, fastest first.
+    """
+    return [codec() for codec, module in CODECS if module is not None]
+
+
+def get_codec(codec=None):
+    """
+    Return a codec. ``codec`` can be a codec, which is returned as-is, a codec
+    name (``"orjson"``, ``"ujson"``, or ``"json"``), ``"fastest"`` to get the
+    fastest installed codec, or ``None`` to get the standard library’s one.
+
+    Faster codecs don’t behave exactly like ``json``: ``orjson`` encodes
+    requests as compact ``bytes`` and rejects ``NaN`` and integers that don’t
+    fit in 64 bits, for example. This is why they must be chosen explicitly.
+
+    Raise ``ValueError`` if the codec is unknown or not installed.
+    """
+    if codec is None:
+        return JSONCodec()
+
+    if codec == "fastest":
+        return available_codecs()[0]
+
+    if not isinstance(codec, str):
+        return codec
+
+    for c in available_codecs():
+        if c.name == codec:
+            return c
+
+    raise ValueError("Unknown or unavailable JSON codec: %r" % codec)
@@ -0,0 +1,264 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Pool of ``Kbg`` clients for many customer accounts.
+"""
+
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+
+from . import Kbg, OfferCache, Profiler, UnauthenticatedKbg
+from .codec import get_codec
+
+
+class KbgPool:
+    """
+    Manage logged-in ``Kbg`` clients for many accounts. Each account has its
+    own ``requests.Session``, but all of them share the same connections, as
+    well as the same stores’ offers cache since it doesn’t depend on the
+    account.
+
+    Work is run in at most ``max_workers`` threads, with at most
+    ``max_per_account`` tasks at once for the same account. Pending tasks are
+    picked from each account in turn, so that an account with a lot of orders
+    doesn’t delay the others.
+
+    Use ``public`` for endpoints that don’t need a logged-in user.
+
+    If ``session`` is given, it’s used by ``public`` and its adapters (which
+    hold the connections) are shared by all accounts; it’s not closed by
+    ``close``.
+
+    ``profile`` and ``codec`` are passed to all clients; if ``profile`` is
+    true but not a ``Profiler``, they share the same new ``Profiler``.
+    """
+
+    def __init__(self, max_workers=4, max_per_account=1, session=None,
+                 profile=None, codec=None):
+        self._owns_session = session is None
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+
+        self.max_workers = max_workers
+        self.max_per_account = max_per_account
+
+        if profile and not isinstance(profile, Profiler):
+            profile = Profiler()
+
+        self._session = session
+        # sessions of the accounts, which share the adapters of _session
+        self._sessions = []
+        self._profile = profile
+        self._codec = get_codec(codec)
+        # /init responses are the same for everyone
+        self._offer_cache = OfferCache()
+        self.public = UnauthenticatedKbg(session=session, profile=profile,
+                                         codec=self._codec,
+                                         offer_cache=self._offer_cache)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.RLock()
+        self._idle = threading.Condition(self._lock)
+        self._accounts = OrderedDict()
+        # account key -> deque of (future, fn, args, kwargs)
+        self._queues = {}
+        # account key -> count of running tasks
+        self._running = {}
+        self._running_total = 0
+        # accounts in the order in which they are visited for the next task
+        self._turns = deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._accounts)
+
+    def __iter__(self):
+        return iter(list(self._accounts))
+
+    def __getitem__(self, key):
+        return self._accounts[key]
+
+    def add_account(self, email, password, key=None, interner=None):
+        """
+        Log in an account and return its ``Kbg`` client. ``key`` identifies
+        the account in the pool; it defaults to ``email``.
+        """
+        if key is None:
+            key = email
+
+        session = requests.Session()
+        for prefix, adapter in self._session.adapters.items():
+            session.mount(prefix, adapter)
+
+        kbg = Kbg(email, password, interner=interner, session=session,
+                  profile=self._profile, codec=self._codec,
+                  offer_cache=self._offer_cache)
+
+        with self._lock:
+            self._sessions.append(session)
+            if key not in self._accounts:
+                self._queues[key] = deque()
+                self._running[key] = 0
+                self._turns.append(key)
+            self._accounts[key] = kbg
+
+        return kbg
+
+    def submit(self, key, fn, *args, **kwargs):
+        """
+        Schedule ``fn(kbg, *args, **kwargs)`` where ``kbg`` is the client of
+        the account ``key``, and return a ``concurrent.futures.Future`` of its
+        result.
+        """
+        future = Future()
+        with self._lock:
+            self._queues[key].append((future, fn, args, kwargs))
+            self._dispatch()
+        return future
+
+    def _next_task(self):
+        for _ in range(len(self._turns)):
+            key = self._turns[0]
+            self._turns.rotate(-1)
+            if self._queues[key] and \
+                    self._running[key] < self.max_per_account:
+                return key, self._queues[key].popleft()
+        return None, None
+
+    def _dispatch(self):
+        # must be called with the lock held
+        while self._running_total < self.max_workers:
+            key, task = self._next_task()
+            if task is None:
+                return
+            future = task[0]
+            if not future.set_running_or_notify_cancel():
+                continue
+            self._running[key] += 1
+            self._running_total += 1
+            self._executor.submit(self._run, key, task)
+
+    def _run(self, key, task):
+        future, fn, args, kwargs = task
+        try:
+            result = fn(self._accounts[key], *args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                self._running[key] -= 1
+                self._running_total -= 1
+                self._dispatch()
+                if self._running_total == 0:
+                    self._idle.notify_all()
+
+    def get_all_customer_orders(self, key, full=False, interner=None):
+        """
+        Return a ``concurrent.futures.Future`` of the list of all the orders of
+        the account ``key``. See ``Kbg.get_all_customer_orders``.
+
+        Each page of orders and, if ``full`` is ``True``, each order’s details
+        is fetched in its own task, so that other accounts get their turn in
+        between.
+        """
+        return _OrdersSync(self, key, full, interner).start()
+
+    def join(self):
+        """
+        Wait until all the submitted tasks are done.
+        """
+        with self._idle:
+            while self._running_total:
+                self._idle.wait()
+
+    def close(self):
+        """
+        Wait for all the submitted tasks, then release the threads and, unless
+        the pool was given a ``session``, the connections.
+        """
+        self.join()
+        self._executor.shutdown(wait=True)
+        if self._owns_session:
+            # closing a session closes its adapters, which belong to the
+            # given session otherwise
+            for session in self._sessions:
+                session.close()
+            self._session.close()
+
+
+class _OrdersSync:
+    """
+    State of a ``KbgPool.get_all_customer_orders`` call.
+    """
+
+    def __init__(self, pool, key, full, interner):
+        self.pool = pool
+        self.key = key
+        self.full = full
+        self.interner = interner
+
+        self.result = Future()
+        self.orders = []
+        # count of scheduled tasks that are not done yet
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.result.set_running_or_notify_cancel()
+        self.schedule(self.fetch_page, 1)
+        return self.result
+
+    def schedule(self, fn, *args):
+        # Must be called without the lock held: submit() takes the pool's
+        # lock, and the callback may run right away.
+        with self.lock:
+            self.pending += 1
+        self.pool.submit(self.key, fn, *args).add_done_callback(self.done)
+
+    def done(self, future):
+        with self.lock:
+            self.pending -= 1
+            if self.result.done():
+                return
+            if future.exception() is not None:
+                self.result.set_exception(future.exception())
+            elif self.pending == 0:
+                self.result.set_result(self.orders)
+
+    def fetch_page(self, kbg, page):
+        if self.result.done():
+            return
+        resp = kbg.get_customer_orders(page=page)
+        with self.lock:
+            start = len(self.orders)
+            self.orders.extend(resp["orders"])
+            end = len(self.orders)
+
+        # This task is still pending, so the result can't be set before the
+        # new tasks are scheduled.
+        if self.full:
+            for i in range(start, end):
+                self.schedule(self.fetch_order, i)
+        if resp["next_page"]:
+            self.schedule(self.fetch_page, resp["next_page"])
+
+    def fetch_order(self, kbg, i):
+        if self.result.done():
+            return
+        order = kbg.get_customer_order(self.orders[i]["id"],
+                                       interner=self.interner)
+        with self.lock:
+            self.orders[i] = order
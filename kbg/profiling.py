@@ -0,0 +1,328 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Opt-in profiling of clients’ methods.
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+import functools
+import inspect
+import tracemalloc
+from contextlib import contextmanager
+
+# CPU time of the current thread, so that concurrent clients (see KbgPool)
+# don't count each other's time. time.thread_time was added in Python 3.7;
+# before, the CPU time is the whole process' one.
+_HAS_THREAD_TIME = hasattr(time, "thread_time")
+_cpu_time = time.thread_time if _HAS_THREAD_TIME else time.process_time
+
+# tracemalloc.reset_peak was added in Python 3.9. Without it, we can only
+# measure the net change of the traced memory.
+_HAS_RESET_PEAK = hasattr(tracemalloc, "reset_peak")
+
+# Phases of a method, for methods that don't run within another one (e.g. the
+# login in Kbg's constructor).
+NO_METHOD = "(other)"
+
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_PHASE = _NullPhase()
+
+
+class Profiler:
+    """
+    Collect the wall and CPU times spent in clients’ methods, and within them
+    in each phase: ``"network"`` for HTTP requests, ``"decode"`` for JSON
+    decoding, and ``"normalize"`` for the post-processing of responses.
+
+    If ``trace_memory`` is true, also track the memory allocated with
+    ``tracemalloc``. This slows the code down significantly. The memory of a
+    call is its peak: the maximum traced memory during the call, minus the
+    traced memory at its start. Before Python 3.9, it’s the net change of the
+    traced memory instead, which can be negative. ``tracemalloc`` traces the
+    whole process: when several threads run at once, e.g. with ``KbgPool``,
+    the figures include the other threads’ allocations.
+
+    CPU times are those of the calling thread. Before Python 3.7, they’re the
+    whole process’ ones instead, which include the other threads’ time.
+
+    Times of nested methods, e.g. ``get_store`` which calls ``get_stores``,
+    are counted in both.
+
+    Call ``close`` to stop ``tracemalloc`` if it was started by the profiler.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # name -> [calls, wall, cpu, max memory]
+        self._methods = {}
+        # (method name, phase name) -> [calls, wall, cpu, max memory]
+        self._phases = {}
+
+        self._started_tracemalloc = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def close(self):
+        """
+        Stop ``tracemalloc`` if it was started by this profiler. The
+        statistics are kept.
+        """
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _memory_frames(self):
+        # [memory at the start, peak so far] of the measures in progress in
+        # the current thread, innermost last
+        if not hasattr(self._local, "memory_frames"):
+            self._local.memory_frames = []
+        return self._local.memory_frames
+
+    def _start_memory(self):
+        if not self.trace_memory or not tracemalloc.is_tracing():
+            return None
+
+        frames = self._memory_frames()
+        current, peak = tracemalloc.get_traced_memory()
+        if _HAS_RESET_PEAK:
+            # save the peak of the outer measure before resetting it
+            if frames:
+                frames[-1][1] = max(frames[-1][1], peak)
+            tracemalloc.reset_peak()
+
+        frame = [current, current]
+        frames.append(frame)
+        return frame
+
+    def _stop_memory(self, frame):
+        if frame is None:
+            return 0
+
+        frames = self._memory_frames()
+        frames.pop()
+        if not tracemalloc.is_tracing():
+            # stopped during the measure
+            return 0
+
+        current, peak = tracemalloc.get_traced_memory()
+        if not _HAS_RESET_PEAK:
+            return current - frame[0]
+
+        peak = max(frame[1], peak)
+        if frames:
+            frames[-1][1] = max(frames[-1][1], peak)
+        return peak - frame[0]
+
+    @contextmanager
+    def _measure(self, table, key, count=True):
+        memory = self._start_memory()
+        cpu = _cpu_time()
+        wall = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = _cpu_time() - cpu
+            memory = self._stop_memory(memory)
+
+            with self._lock:
+                stats = table.setdefault(key, [0, 0.0, 0.0, None])
+                if count:
+                    stats[0] += 1
+                stats[1] += wall
+                stats[2] += cpu
+                if stats[3] is None or memory > stats[3]:
+                    stats[3] = memory
+
+    @contextmanager
+    def method(self, name, count=True):
+        """
+        Context manager to measure a call to the method ``name``. Phases within
+        it are attributed to that method. If ``count`` is false, the time is
+        added to the method but not its calls count.
+        """
+        stack = self._stack()
+        stack.append(name)
+        try:
+            with self._measure(self._methods, name, count=count):
+                yield
+        finally:
+            stack.pop()
+
+    def phase(self, name):
+        """
+        Context manager to measure a phase of the current method.
+        """
+        stack = self._stack()
+        method = stack[-1] if stack else NO_METHOD
+        return self._measure(self._phases, (method, name))
+
+    def wrap(self, name, fn):
+        """
+        Return a version of ``fn`` which is measured as the method ``name``.
+        For generator functions, the time spent to produce each item is
+        measured too.
+        """
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.method(name):
+                    it = fn(*args, **kwargs)
+                while True:
+                    with self.method(name, count=False):
+                        try:
+                            item = next(it)
+                        except StopIteration:
+                            return
+                    yield item
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.method(name):
+                    return fn(*args, **kwargs)
+
+        return wrapper
+
+    def reset(self):
+        """
+        Forget all the collected statistics.
+        """
+        with self._lock:
+            self._methods.clear()
+            self._phases.clear()
+
+    def stats(self):
+        """
+        Return a ``dict`` with a ``"methods"`` key, mapping methods’ names to
+        their statistics, and a ``"phases"`` key, mapping methods’ names to
+        their phases’ names to their statistics. Statistics are ``dict``s with
+        the keys ``"calls"``, ``"wall"`` and ``"cpu"`` (in seconds), and
+        ``"memory"``: the largest memory of a single call in bytes (see
+        ``Profiler``); always 0 if ``trace_memory`` is false.
+        """
+        def to_dict(stats):
+            calls, wall, cpu, memory = stats
+            return {"calls": calls, "wall": wall, "cpu": cpu,
+                    "memory": memory or 0}
+
+        with self._lock:
+            methods = {name: to_dict(stats)
+                       for name, stats in self._methods.items()}
+            phases = {}
+            for (method, phase), stats in self._phases.items():
+                phases.setdefault(method, {})[phase] = to_dict(stats)
+
+        return {"methods": methods, "phases": phases}
+
+    def report(self):
+        """
+        Return a human-readable report of the statistics, with the slowest
+        methods first.
+        """
+        stats = self.stats()
+        methods = stats["methods"]
+        phases = stats["phases"]
+        # phases outside of any method
+        for name in phases:
+            methods.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0,
+                                      "memory": 0})
+
+        header = "%-30s %8s %10s %10s" % (
+            "Method", "Calls", "Wall (s)",
+            "CPU (s)" if _HAS_THREAD_TIME else "Proc CPU (s)")
+        line_format = "%-30s %8d %10.4f %10.4f"
+        if self.trace_memory:
+            header += " %14s" % ("Peak mem (B)" if _HAS_RESET_PEAK
+                                 else "Net mem (B)")
+            line_format += " %14d"
+
+        def line(name, s):
+            values = (name, s["calls"], s["wall"], s["cpu"])
+            if self.trace_memory:
+                values += (s["memory"],)
+            return line_format % values
+
+        lines = [header]
+        for name in sorted(methods, key=lambda m: -methods[m]["wall"]):
+            lines.append(line(name, methods[name]))
+            method_phases = phases.get(name, {})
+            for phase in sorted(method_phases):
+                lines.append(line("  " + phase, method_phases[phase]))
+
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """
+        Write the statistics in the file ``path``: as JSON if its name ends
+        with ``.json``, as returned by ``report`` otherwise.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith(".json"):
+                json.dump(self.stats(), f, indent=2, sort_keys=True)
+            else:
+                f.write(self.report())
+
+
+def get_profiler(profile=None):
+    """
+    Return the ``Profiler`` to use for a ``profile`` argument: ``profile``
+    itself if it’s a ``Profiler``, a new one if it’s any other true value,
+    ``None`` if it’s a false value, or the one of ``env_profiler`` if it’s
+    ``None``.
+    """
+    if profile is None:
+        return env_profiler()
+    if isinstance(profile, Profiler):
+        return profile
+    if profile:
+        return Profiler()
+    return None
+
+
+_env_profiler = None
+_env_profiler_lock = threading.Lock()
+
+
+def env_profiler():
+    """
+    Return the profiler enabled by the ``KBG_PROFILE`` environment variable,
+    or ``None`` if it’s not set (or set to ``0``). It’s shared by all clients.
+
+    Use ``KBG_PROFILE=memory`` to also track memory allocations. If
+    ``KBG_PROFILE_FILE`` is set, the statistics are dumped in this file when
+    the program exits.
+    """
+    global _env_profiler
+
+    value = os.environ.get("KBG_PROFILE", "")
+    if value in ("", "0"):
+        return None
+
+    with _env_profiler_lock:
+        if _env_profiler is None:
+            _env_profiler = Profiler(trace_memory=(value == "memory"))
+            path = os.environ.get("KBG_PROFILE_FILE")
+            if path:
+                atexit.register(_env_profiler.dump, path)
+
+    return _env_profiler
@@ -0,0 +1,276 @@
+# -*- coding: UTF-8 -*-
+
+"""
+In-memory search index over a store offer.
+"""
+
+import re
+import heapq
+import bisect
+import threading
+import unicodedata
+
+# How much a match in each field counts in a product's score.
+FIELD_WEIGHTS = (
+    ("product_name", 3.0),
+    ("producer_name", 2.0),
+    ("family", 1.5),
+    ("category", 1.0),
+)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Ligatures that NFKD doesn't decompose: "Œufs" must match "oeufs".
+_LIGATURES = str.maketrans({
+    "œ": "oe",
+    "Œ": "OE",
+    "æ": "ae",
+    "Æ": "AE",
+})
+
+
+def normalize(text):
+    """
+    Return a lower-case, accent-free version of ``text``: ``"Bières"`` becomes
+    ``"bieres"``, and ``"Œufs"`` becomes ``"oeufs"``.
+    """
+    if not text:
+        return ""
+    text = text.translate(_LIGATURES)
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return text.casefold()
+
+
+def tokenize(text):
+    """
+    Return the list of normalized words in ``text``.
+    """
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def trigrams(token):
+    """
+    Return the set of trigrams of a token, padded so that short tokens and
+    word boundaries get trigrams too.
+    """
+    padded = "  %s " % token
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+
+def _items(xs):
+    # The offer values are lists, but get_store_offer_dicts returns dicts
+    # mapping ids to items.
+    if isinstance(xs, dict):
+        return xs.values()
+    return xs or ()
+
+
+class OfferIndex:
+    """
+    Search index over the products of a store offer as returned by
+    ``get_store_offer``. Products are indexed by their name, their producer’s
+    name, and the names of their family and category.
+
+    Use ``update`` to refresh the index with a new offer: only the products
+    that changed are re-indexed. An index can be searched and updated from
+    several threads.
+    """
+
+    def __init__(self, offer=None):
+        self._lock = threading.RLock()
+        self._products = {}
+        # product id -> tuple of (field, text) that was indexed for it
+        self._documents = {}
+        # product id -> {token: weight}
+        self._product_tokens = {}
+        # token -> {product id: weight}
+        self._postings = {}
+        # sorted list of all indexed tokens, for prefix matching
+        self._tokens = []
+        # trigram -> set of tokens, for fuzzy matching
+        self._trigrams = {}
+
+        if offer is not None:
+            self.update(offer)
+
+    def __len__(self):
+        return len(self._products)
+
+    def __contains__(self, product_id):
+        return product_id in self._products
+
+    def _document(self, product, families, categories):
+        family = families.get(product.get("family_id"), {})
+        category_id = product.get("category_id", family.get("category_id"))
+        category = categories.get(category_id, {})
+
+        values = {
+            "product_name": product.get("product_name"),
+            "producer_name": product.get("producer_name"),
+            "family": family.get("name"),
+            "category": category.get("name"),
+        }
+        return tuple((field, values[field] or "")
+                     for field, _ in FIELD_WEIGHTS)
+
+    def _add_token(self, token):
+        bisect.insort(self._tokens, token)
+        for trigram in trigrams(token):
+            self._trigrams.setdefault(trigram, set()).add(token)
+
+    def _remove_token(self, token):
+        del self._postings[token]
+        i = bisect.bisect_left(self._tokens, token)
+        del self._tokens[i]
+        for trigram in trigrams(token):
+            tokens = self._trigrams[trigram]
+            tokens.discard(token)
+            if not tokens:
+                del self._trigrams[trigram]
+
+    def _add(self, product_id, product, document):
+        weights = dict(FIELD_WEIGHTS)
+        tokens = {}
+        for field, text in document:
+            for token in tokenize(text):
+                tokens[token] = max(tokens.get(token, 0), weights[field])
+
+        for token, weight in tokens.items():
+            if token not in self._postings:
+                self._postings[token] = {}
+                self._add_token(token)
+            self._postings[token][product_id] = weight
+
+        self._products[product_id] = product
+        self._documents[product_id] = document
+        self._product_tokens[product_id] = tokens
+
+    def _remove(self, product_id):
+        for token in self._product_tokens.pop(product_id):
+            postings = self._postings[token]
+            del postings[product_id]
+            if not postings:
+                self._remove_token(token)
+
+        del self._products[product_id]
+        del self._documents[product_id]
+
+    def update(self, offer):
+        """
+        Synchronize the index with ``offer``. Products that are no longer in
+        the offer are removed, new ones are added, and existing ones are
+        re-indexed only if one of their indexed fields changed.
+        """
+        with self._lock:
+            self._update(offer)
+
+    def _update(self, offer):
+        families = {f["id"]: f for f in _items(offer.get("families"))}
+        categories = {c["id"]: c for c in _items(offer.get("categories"))}
+
+        seen = set()
+        for product in _items(offer.get("products")):
+            product_id = product["id"]
+            seen.add(product_id)
+            document = self._document(product, families, categories)
+
+            if product_id in self._products:
+                if self._documents[product_id] == document:
+                    # keep the freshest version of the product (e.g. a new
+                    # price) without touching the index
+                    self._products[product_id] = product
+                    continue
+                self._remove(product_id)
+
+            self._add(product_id, product, document)
+
+        for product_id in list(self._products):
+            if product_id not in seen:
+                self._remove(product_id)
+
+    def _prefix_matches(self, token):
+        i = bisect.bisect_left(self._tokens, token)
+        while i < len(self._tokens) and self._tokens[i].startswith(token):
+            yield self._tokens[i]
+            i += 1
+
+    def _fuzzy_matches(self, token, min_similarity):
+        query_trigrams = trigrams(token)
+        shared = {}
+        for trigram in query_trigrams:
+            for candidate in self._trigrams.get(trigram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        for candidate, n in shared.items():
+            total = len(query_trigrams) + len(trigrams(candidate)) - n
+            similarity = n / total
+            if similarity >= min_similarity:
+                yield candidate, similarity
+
+    def _token_scores(self, token, fuzzy, min_similarity):
+        # Return a dict of product id -> best score for this query token.
+        matches = {}
+        for candidate in self._prefix_matches(token):
+            if candidate == token:
+                quality = 1.0
+            else:
+                quality = 0.5 + 0.4 * len(token) / len(candidate)
+            matches[candidate] = quality
+
+        if fuzzy and len(token) >= 3:
+            for candidate, similarity in self._fuzzy_matches(token,
+                                                             min_similarity):
+                quality = 0.4 * similarity
+                if quality > matches.get(candidate, 0):
+                    matches[candidate] = quality
+
+        scores = {}
+        for candidate, quality in matches.items():
+            for product_id, weight in self._postings[candidate].items():
+                score = quality * weight
+                if score > scores.get(product_id, 0):
+                    scores[product_id] = score
+        return scores
+
+    def search(self, query, limit=10, fuzzy=True, min_similarity=0.4):
+        """
+        Return a list of at most ``limit`` products matching ``query``, best
+        matches first.
+
+        Every word of the query must match a word of the product, either
+        exactly, as a prefix (``"bie"`` matches ``"Bière"``) or, if ``fuzzy``
+        is true, approximately (``"biere"`` matches ``"bierre"``). Accents and
+        case are ignored.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        with self._lock:
+            return self._search(tokens, limit, fuzzy, min_similarity)
+
+    def _search(self, tokens, limit, fuzzy, min_similarity):
+        scores = None
+        for token in tokens:
+            token_scores = self._token_scores(token, fuzzy, min_similarity)
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {pid: score + token_scores[pid]
+                          for pid, score in scores.items()
+                          if pid in token_scores}
+            if not scores:
+                return []
+
+        def sort_key(product_id):
+            name = self._products[product_id].get("product_name") or ""
+            return (-scores[product_id], normalize(name))
+
+        # short prefixes match most of the offer: don't sort all the matches
+        # to keep only a few of them
+        if limit is None:
+            ranked = sorted(scores, key=sort_key)
+        else:
+            ranked = heapq.nsmallest(limit, scores, key=sort_key)
+        return [self._products[pid] for pid in ranked]
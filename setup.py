@@ -27,8 +27,9 @@ setup(
     install_requires=[
         'requests',
     ],
-    extra_require={
+    extras_require={
         'dev': ['responses'],
+        'fast': ['orjson'],
     },
     classifiers=[
         'Environment :: Console',
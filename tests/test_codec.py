@@ -0,0 +1,97 @@
+# -*- coding: UTF-8 -*-
+
+import responses
+import unittest
+
+import kbg as k
+from kbg import codec as c
+
+
+class CountingCodec(c.JSONCodec):
+    name = "counting"
+
+    def __init__(self):
+        self.dumps_calls = 0
+        self.loads_calls = 0
+
+    def dumps(self, obj):
+        self.dumps_calls += 1
+        return super().dumps(obj)
+
+    def loads(self, data):
+        self.loads_calls += 1
+        self.assertIsBytes(data)
+        return super().loads(data)
+
+    def assertIsBytes(self, data):
+        if not isinstance(data, bytes):
+            raise AssertionError("%r is not bytes" % data)
+
+
+class TestCodecs(unittest.TestCase):
+    def test_roundtrip(self):
+        obj = {"product_name": "Bière", "n": [1, 2.5, None, True]}
+        for codec in c.available_codecs():
+            encoded = codec.dumps(obj)
+            if isinstance(encoded, str):
+                encoded = encoded.encode("utf-8")
+            self.assertEqual(obj, codec.loads(encoded), codec.name)
+
+    def test_available_codecs(self):
+        names = [codec.name for codec in c.available_codecs()]
+        self.assertEqual("json", names[-1])
+        if c.orjson is not None:
+            self.assertEqual("orjson", names[0])
+
+    def test_get_codec(self):
+        self.assertEqual("json", c.get_codec().name)
+        self.assertEqual("json", c.get_codec("json").name)
+        self.assertEqual(c.available_codecs()[0].name,
+                         c.get_codec("fastest").name)
+
+        codec = CountingCodec()
+        self.assertIs(codec, c.get_codec(codec))
+
+        self.assertRaises(ValueError, c.get_codec, "yaml")
+
+    @unittest.skipIf(c.orjson is None, "orjson is not installed")
+    def test_get_codec_orjson(self):
+        self.assertIsInstance(c.get_codec("orjson"), c.OrjsonCodec)
+
+
+class TestKbgCodec(unittest.TestCase):
+    def test_codec(self):
+        codec = CountingCodec()
+
+        with responses.RequestsMock() as resps:
+            resps.add(responses.POST, k.API_ENDPOINT + "/login",
+                      json={"token": "abc"})
+            resps.add(responses.GET, k.API_ENDPOINT + "/api/consumer",
+                      json={"consumer": {"first_name": "Zoé"}})
+
+            kbg = k.Kbg("a@example.com", "pass", codec=codec)
+            self.assertEqual(b'{"email": "a@example.com", '
+                             b'"password": "pass"}',
+                             resps.calls[0].request.body.encode("utf-8"))
+            self.assertEqual({"first_name": "Zoé"},
+                             kbg.get_customer_information())
+
+        self.assertEqual(1, codec.dumps_calls)
+        self.assertEqual(2, codec.loads_calls)
+
+    def test_codec_default(self):
+        self.assertEqual("json", k.UnauthenticatedKbg()._codec.name)
+
+    @unittest.skipIf(c.orjson is None, "orjson is not installed")
+    def test_codec_orjson(self):
+        with responses.RequestsMock() as resps:
+            resps.add(responses.POST, k.API_ENDPOINT + "/login",
+                      json={"token": "abc"})
+            resps.add(responses.GET, k.API_ENDPOINT + "/api/consumer",
+                      json={"consumer": {"first_name": "Zoé"}})
+
+            kbg = k.Kbg("a@example.com", "pass", codec="orjson")
+            self.assertEqual(b'{"email":"a@example.com","password":"pass"}',
+                             resps.calls[0].request.body)
+            self.assertEqual({"first_name": "Zoé"},
+                             kbg.get_customer_information())
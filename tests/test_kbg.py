@@ -30,6 +30,42 @@ class TestUtilities(unittest.TestCase):
                 [{"id": 1, "_id": "xx"}, {"_id": 2}, {"id": 3}]))
 
 
+class TestInterner(unittest.TestCase):
+    def test_intern(self):
+        interner = k.Interner()
+        a = interner.intern({"name": "".join(["a", "b"]), "n": 1,
+                             "tags": ["".join(["x", "y"])]})
+        b = interner.intern({"name": "".join(["a", "b"]), "n": 1,
+                             "tags": ["".join(["x", "y"])]})
+        self.assertEqual(a, b)
+        self.assertIs(a["name"], b["name"])
+        self.assertIs(a["tags"][0], b["tags"][0])
+        self.assertEqual(5, len(interner))
+
+        interner.clear()
+        self.assertEqual(0, len(interner))
+
+    def test_intern_keys(self):
+        interner = k.Interner()
+        value = "".join(["x", "y"])
+        a = interner.intern_keys({"".join(["k", "1"]): value})
+        b = interner.intern_keys({"".join(["k", "1"]): value})
+        self.assertIs(list(a)[0], list(b)[0])
+        self.assertEqual(1, len(interner))
+
+    def test_product_info(self):
+        interner = k.Interner()
+        info1 = interner.product_info("p1", {"product_name": "product 1"})
+        info2 = interner.product_info("p1", {"product_name": "product 1"})
+        self.assertIs(info1, info2)
+
+        info3 = interner.product_info("p1", {"product_name": "product 1b"})
+        self.assertIsNot(info1, info3)
+        self.assertEqual({"product_name": "product 1b"}, info3)
+        self.assertIs(info3, interner.product_info(
+            "p1", {"product_name": "product 1b"}))
+
+
 class TestUnauthenticatedKbg(unittest.TestCase):
     def setUp(self):
         with responses.RequestsMock() as resps:
@@ -148,6 +184,11 @@ class TestUnauthenticatedKbg(unittest.TestCase):
             "producers": {"P1": {"id": "P1", "name": "A"}},
         }, offer_dict)
 
+        # the cached offer is left as-is
+        self.assertEqual([{"id": "p1"}, {"id": "p2"}],
+                         self.k.get_store_offer(store)["products"])
+        self.assertEqual(offer_dict, self.k.get_store_offer_dicts(store))
+
 
 class TestKbg(unittest.TestCase):
     def setUp(self):
@@ -381,6 +422,87 @@ class TestKbg(unittest.TestCase):
                 ],
             }, order)
 
+    def mock_order_details(self, resps):
+        def order_detail(request):
+            m = re.match(r".*\?order_id=(\w+)", request.url)
+            resp_body = {
+                "order": {
+                    "_id": m.group(1),
+                    "locale": "XYZ",
+                    "items": [
+                        {"producerproduct_id": "p1", "quantity": 1},
+                    ],
+                    "producerproducts": [
+                        {"_id": "p1", "product_name": "product 1",
+                         "description": "some long description"},
+                    ],
+                }
+            }
+            return (200, {}, json.dumps(resp_body))
+
+        resps.add_callback(
+                responses.GET,
+                k.API_ENDPOINT + "/api/orders/fetch-detail",
+                content_type="application/json",
+                callback=order_detail)
+
+    def test_get_customer_order_interner(self):
+        interner = k.Interner()
+
+        with responses.RequestsMock() as resps:
+            self.mock_order_details(resps)
+            order1 = self.k.get_customer_order("xx", interner=interner)
+            order2 = self.k.get_customer_order("yy", interner=interner)
+            order3 = self.k.get_customer_order("zz")
+
+        self.assertEqual({
+            "id": "yy",
+            "store": "XYZ",
+            "products": [
+                {"id": "p1", "product_name": "product 1",
+                 "description": "some long description", "quantity": 1},
+            ],
+        }, order2)
+
+        product1 = order1["products"][0]
+        product2 = order2["products"][0]
+        product3 = order3["products"][0]
+        self.assertIs(product1["description"], product2["description"])
+        self.assertIsNot(product1["description"], product3["description"])
+
+        keys1 = {key: key for key in order1}
+        for key in order2:
+            self.assertIs(keys1[key], key)
+
+        # per-order values are not kept
+        self.assertNotIn("xx", interner._strings)
+        self.assertNotIn("yy", interner._strings)
+
+    def test_get_customer_order_interner_no_merge(self):
+        interner = k.Interner(merge=False)
+
+        with responses.RequestsMock() as resps:
+            self.mock_order_details(resps)
+            order1 = self.k.get_customer_order("xx", interner=interner)
+            order2 = self.k.get_customer_order("yy", interner=interner)
+
+        self.assertEqual({
+            "id": "xx",
+            "store": "XYZ",
+            "products": [
+                {"id": "p1", "quantity": 1,
+                 "product": {"product_name": "product 1",
+                             "description": "some long description"}},
+            ],
+        }, order1)
+        self.assertIs(order1["products"][0]["product"],
+                      order2["products"][0]["product"])
+
+        # the record is shared, not copied: it must be treated as read-only
+        order1["products"][0]["product"]["product_name"] = "changed"
+        self.assertEqual("changed",
+                         order2["products"][0]["product"]["product_name"])
+
     def test_get_store_status(self):
         with responses.RequestsMock() as resps:
             closed_tags = ["FRAIS", "ORDERS"]
@@ -0,0 +1,184 @@
+# -*- coding: UTF-8 -*-
+
+import re
+import json
+import threading
+import requests
+import responses
+import unittest
+from unittest import mock
+
+import kbg as k
+from kbg.pool import KbgPool
+
+
+def login(request):
+    email = json.loads(request.body)["email"]
+    return (200, {}, json.dumps({"token": "token-%s" % email}))
+
+
+class TestKbgPool(unittest.TestCase):
+    def setUp(self):
+        self.resps = responses.RequestsMock(assert_all_requests_are_fired=False)
+        self.resps.start()
+        self.addCleanup(self.resps.stop)
+        self.addCleanup(self.resps.reset)
+
+        self.resps.add_callback(responses.POST, k.API_ENDPOINT + "/login",
+                                content_type="application/json",
+                                callback=login)
+
+        self.pool = KbgPool(max_workers=2)
+        self.addCleanup(self.pool.close)
+
+        self.pool.add_account("a@example.com", "pass", key="a")
+        self.pool.add_account("b@example.com", "pass", key="b")
+
+    def test_accounts(self):
+        self.assertEqual(["a", "b"], list(self.pool))
+        self.assertEqual(2, len(self.pool))
+        self.assertEqual("token-a@example.com", self.pool["a"]._token)
+        self.assertEqual("token-b@example.com", self.pool["b"]._token)
+
+        # separate sessions (and cookies) over the same connections
+        session_a = self.pool["a"]._session
+        session_b = self.pool["b"]._session
+        self.assertIsNot(session_a, session_b)
+        self.assertIsNot(session_a.cookies, session_b.cookies)
+        url = k.API_ENDPOINT + "/login"
+        self.assertIs(session_a.get_adapter(url), session_b.get_adapter(url))
+        self.assertIs(self.pool.public._session.get_adapter(url),
+                      session_a.get_adapter(url))
+
+    def test_profile(self):
+        pool = KbgPool(profile=1)
+        self.addCleanup(pool.close)
+        pool.add_account("c@example.com", "pass")
+        self.assertIsInstance(pool.public.profiler, k.Profiler)
+        self.assertIs(pool.public.profiler, pool["c@example.com"].profiler)
+
+    def test_close(self):
+        pool = KbgPool()
+        pool.add_account("a@example.com", "pass")
+        sessions = [pool._session, pool["a@example.com"]._session]
+        with mock.patch.object(requests.Session, "close") as close:
+            pool.close()
+        self.assertEqual(len(sessions), close.call_count)
+
+    def test_close_given_session(self):
+        session = requests.Session()
+        pool = KbgPool(session=session)
+        pool.add_account("a@example.com", "pass")
+        self.assertIs(session, pool.public._session)
+        with mock.patch.object(requests.Session, "close") as close:
+            pool.close()
+        close.assert_not_called()
+
+    def test_shared_offers(self):
+        offer = {"products": [], "categories": [], "promogroups": [],
+                 "families": [], "producers": []}
+        self.resps.add(responses.GET, k.API_ENDPOINT + "/init", json=offer)
+
+        self.assertEqual(offer, self.pool["a"].get_store_offer("XYZ"))
+        self.assertEqual(offer, self.pool["b"].get_store_offer("XYZ"))
+        self.assertEqual(offer, self.pool.public.get_store_offer("XYZ"))
+        init_calls = [c for c in self.resps.calls
+                      if "/init" in c.request.url]
+        self.assertEqual(1, len(init_calls))
+
+    def test_submit(self):
+        future = self.pool.submit("a", lambda kbg, x: (kbg._token, x), 42)
+        self.assertEqual(("token-a@example.com", 42), future.result())
+
+        def fail(kbg):
+            raise ValueError("nope")
+
+        self.assertRaises(ValueError, self.pool.submit("b", fail).result)
+
+    def test_submit_fairness(self):
+        started = []
+
+        def task(kbg, name):
+            started.append(name)
+
+        # one task at a time so that the order is deterministic
+        self.pool.max_workers = 1
+        with self.pool._lock:
+            # queue everything before any task can end
+            futures = [self.pool.submit("a", task, "a%d" % i)
+                       for i in range(3)]
+            futures.append(self.pool.submit("b", task, "b0"))
+
+        for future in futures:
+            future.result()
+
+        # "b" doesn’t wait for all of "a"’s tasks
+        self.assertEqual(["a0", "b0", "a1", "a2"], started)
+
+    def test_max_per_account(self):
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+
+        def task(kbg):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            threading.Event().wait(0.01)
+            with lock:
+                running[0] -= 1
+
+        futures = [self.pool.submit("a", task) for _ in range(5)]
+        for future in futures:
+            future.result()
+        self.assertEqual(1, peak[0])
+
+    def test_get_all_customer_orders(self):
+        orders_pages = {
+            1: [{"_id": "o1", "locale": "ABC", "items": [{"_id": "p1"}]}],
+            2: [{"_id": "o2", "locale": "ABC", "items": [{"_id": "p2"}]}],
+        }
+
+        def get_orders(request):
+            self.assertEqual("Bearer token-a@example.com",
+                             request.headers["Authorization"])
+            page = int(re.match(r".*\?page=(\d+)", request.url).group(1))
+            return (200, {}, json.dumps({
+                "items": orders_pages[page], "count": 11}))
+
+        def get_order(request):
+            order_id = re.match(r".*\?order_id=(\w+)",
+                                request.url).group(1)
+            return (200, {}, json.dumps({"order": {
+                "_id": order_id,
+                "locale": "ABC",
+                "items": [{"producerproduct_id": "p1", "quantity": 1}],
+                "producerproducts": [{"_id": "p1", "product_name": "P1"}],
+            }}))
+
+        self.resps.add_callback(
+                responses.GET,
+                k.API_ENDPOINT + "/api/orders/fetch-for-consumer",
+                content_type="application/json",
+                callback=get_orders)
+        self.resps.add_callback(
+                responses.GET,
+                k.API_ENDPOINT + "/api/orders/fetch-detail",
+                content_type="application/json",
+                callback=get_order)
+
+        orders = self.pool.get_all_customer_orders("a").result()
+        self.assertEqual(["o1", "o2"], [o["id"] for o in orders])
+        self.assertEqual([{"id": "p1"}], orders[0]["products"])
+
+        orders = self.pool.get_all_customer_orders("a", full=True).result()
+        self.assertEqual(["o1", "o2"], [o["id"] for o in orders])
+        self.assertEqual([{"id": "p1", "product_name": "P1", "quantity": 1}],
+                         orders[1]["products"])
+
+    def test_get_all_customer_orders_error(self):
+        self.resps.add(responses.GET,
+                       k.API_ENDPOINT + "/api/orders/fetch-for-consumer",
+                       status=500)
+        future = self.pool.get_all_customer_orders("b")
+        self.assertRaises(Exception, future.result)
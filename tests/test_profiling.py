@@ -0,0 +1,232 @@
+# -*- coding: UTF-8 -*-
+
+import os
+import json
+import shutil
+import tempfile
+import tracemalloc
+import responses
+import unittest
+from unittest import mock
+
+import kbg as k
+from kbg import profiling as p
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.profiler = p.Profiler()
+
+    def test_method(self):
+        with self.profiler.method("foo"):
+            with self.profiler.phase("network"):
+                pass
+            with self.profiler.method("bar"):
+                with self.profiler.phase("decode"):
+                    pass
+        with self.profiler.phase("normalize"):
+            pass
+
+        stats = self.profiler.stats()
+        self.assertEqual({"foo", "bar"}, set(stats["methods"]))
+        self.assertEqual(1, stats["methods"]["foo"]["calls"])
+        self.assertGreaterEqual(stats["methods"]["foo"]["wall"],
+                                stats["methods"]["bar"]["wall"])
+        self.assertEqual(0, stats["methods"]["foo"]["memory"])
+        self.assertEqual({
+            "foo": {"network"},
+            "bar": {"decode"},
+            p.NO_METHOD: {"normalize"},
+        }, {m: set(phases) for m, phases in stats["phases"].items()})
+
+        self.profiler.reset()
+        self.assertEqual({"methods": {}, "phases": {}},
+                         self.profiler.stats())
+
+    def test_method_exception(self):
+        def fail():
+            with self.profiler.method("foo"):
+                raise ValueError()
+
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(1, self.profiler.stats()["methods"]["foo"]["calls"])
+        self.assertEqual([], self.profiler._stack())
+
+    def test_wrap(self):
+        f = self.profiler.wrap("f", lambda x: x + 1)
+        self.assertEqual(2, f(1))
+        self.assertEqual(3, f(2))
+        self.assertEqual(2, self.profiler.stats()["methods"]["f"]["calls"])
+
+    def test_wrap_generator(self):
+        def gen(n):
+            for i in range(n):
+                with self.profiler.phase("network"):
+                    yield i
+
+        g = self.profiler.wrap("gen", gen)
+        self.assertEqual([0, 1, 2], list(g(3)))
+
+        stats = self.profiler.stats()
+        self.assertEqual(1, stats["methods"]["gen"]["calls"])
+        self.assertEqual(3, stats["phases"]["gen"]["network"]["calls"])
+
+    def test_trace_memory(self):
+        if tracemalloc.is_tracing():
+            self.skipTest("tracemalloc is already tracing")
+
+        profiler = p.Profiler(trace_memory=True)
+        self.addCleanup(profiler.close)
+        self.assertTrue(tracemalloc.is_tracing())
+
+        with profiler.method("foo"):
+            with profiler.phase("decode"):
+                x = [object() for _ in range(1000)]
+                del x
+            with profiler.phase("normalize"):
+                pass
+
+        stats = profiler.stats()
+        memory = stats["methods"]["foo"]["memory"]
+        if p._HAS_RESET_PEAK:
+            # the peak isn't lost when the allocated memory is freed, nor
+            # when a nested phase resets it
+            self.assertGreater(memory, 16000)
+            self.assertGreaterEqual(memory,
+                                    stats["phases"]["foo"]["decode"]["memory"])
+            self.assertLess(stats["phases"]["foo"]["normalize"]["memory"],
+                            memory)
+            self.assertIn("Peak mem (B)", profiler.report())
+        else:  # pragma: no cover
+            self.assertIn("Net mem (B)", profiler.report())
+
+        profiler.close()
+        self.assertFalse(tracemalloc.is_tracing())
+        # the statistics are kept
+        self.assertEqual(memory, profiler.stats()["methods"]["foo"]["memory"])
+        with profiler.method("foo"):
+            pass
+
+    def test_trace_memory_already_tracing(self):
+        if tracemalloc.is_tracing():
+            self.skipTest("tracemalloc is already tracing")
+
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        p.Profiler(trace_memory=True).close()
+        self.assertTrue(tracemalloc.is_tracing())
+
+    def test_report(self):
+        with self.profiler.method("foo"):
+            with self.profiler.phase("network"):
+                pass
+        lines = self.profiler.report().splitlines()
+        self.assertEqual(3, len(lines))
+        self.assertTrue(lines[0].startswith("Method"))
+        self.assertTrue(lines[1].startswith("foo "))
+        self.assertTrue(lines[2].startswith("  network "))
+
+    def test_report_process_cpu(self):
+        self.assertNotIn("Proc CPU (s)", self.profiler.report())
+        with mock.patch.object(p, "_HAS_THREAD_TIME", False):
+            self.assertIn("Proc CPU (s)", self.profiler.report())
+
+    def test_dump(self):
+        with self.profiler.method("foo"):
+            pass
+
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+
+        path = os.path.join(tmp, "profile.json")
+        self.profiler.dump(path)
+        with open(path) as f:
+            self.assertEqual(self.profiler.stats(), json.load(f))
+
+        path = os.path.join(tmp, "profile.txt")
+        self.profiler.dump(path)
+        with open(path) as f:
+            self.assertEqual(self.profiler.report(), f.read())
+
+
+class TestEnvProfiler(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(p, "_env_profiler", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_disabled(self):
+        with mock.patch.dict(os.environ, {"KBG_PROFILE": "0"}):
+            self.assertIsNone(p.env_profiler())
+            self.assertIsNone(k.UnauthenticatedKbg().profiler)
+
+    def test_enabled(self):
+        with mock.patch.dict(os.environ, {"KBG_PROFILE": "1"}):
+            profiler = p.env_profiler()
+            self.assertIsNotNone(profiler)
+            self.assertFalse(profiler.trace_memory)
+            self.assertIs(profiler, k.UnauthenticatedKbg().profiler)
+            self.assertIsNone(k.UnauthenticatedKbg(profile=False).profiler)
+
+    def test_file(self):
+        env = {"KBG_PROFILE": "memory", "KBG_PROFILE_FILE": "x.txt"}
+        with mock.patch.dict(os.environ, env), \
+                mock.patch("atexit.register") as register:
+            profiler = p.env_profiler()
+            self.addCleanup(profiler.close)
+            self.assertTrue(profiler.trace_memory)
+            register.assert_called_once_with(profiler.dump, "x.txt")
+
+
+class TestProfiledKbg(unittest.TestCase):
+    def test_methods(self):
+        kbg = k.UnauthenticatedKbg(profile=True)
+        offer = {"products": [{"_id": "p1"}], "categories": [],
+                 "promogroups": [], "families": [], "producers": []}
+
+        with responses.RequestsMock() as resps:
+            resps.add(responses.GET, k.API_ENDPOINT + "/init", json=offer)
+            self.assertEqual([{"id": "p1"}],
+                             kbg.get_store_offer("XYZ")["products"])
+
+        stats = kbg.profiler.stats()
+        self.assertEqual(1, stats["methods"]["get_store_offer"]["calls"])
+        self.assertEqual({"network", "decode", "normalize"},
+                         set(stats["phases"]["get_store_offer"]))
+
+    def test_profile_argument(self):
+        for profile in (True, 1, "yes"):
+            profiler = k.UnauthenticatedKbg(profile=profile).profiler
+            self.assertIsInstance(profiler, p.Profiler)
+
+        for profile in (False, 0, ""):
+            self.assertIsNone(k.UnauthenticatedKbg(profile=profile).profiler)
+
+        profiler = p.Profiler()
+        self.assertIs(profiler,
+                      k.UnauthenticatedKbg(profile=profiler).profiler)
+
+    def test_shared_profiler(self):
+        profiler = p.Profiler()
+        kbg1 = k.UnauthenticatedKbg(profile=profiler)
+        kbg2 = k.UnauthenticatedKbg(profile=profiler)
+
+        with responses.RequestsMock() as resps:
+            resps.add(responses.GET, k.API_ENDPOINT + "/locales",
+                      json={"locales": []})
+            kbg1.get_stores()
+            kbg2.get_store("ABC")
+
+        stats = profiler.stats()
+        self.assertEqual(2, stats["methods"]["get_stores"]["calls"])
+        self.assertEqual(1, stats["methods"]["get_store"]["calls"])
+        self.assertNotIn("get_store", stats["phases"])
+
+    def test_login(self):
+        with responses.RequestsMock() as resps:
+            resps.add(responses.POST, k.API_ENDPOINT + "/login",
+                      json={"token": "abc"})
+            kbg = k.Kbg("a@example.com", "pass", profile=True)
+
+        phases = kbg.profiler.stats()["phases"]
+        self.assertEqual({"network", "decode"}, set(phases[p.NO_METHOD]))
@@ -0,0 +1,263 @@
+# -*- coding: UTF-8 -*-
+
+import json
+import threading
+import responses
+import unittest
+
+import kbg as k
+from kbg import search as s
+
+
+def make_offer():
+    return {
+        "products": [
+            {"id": "p1", "product_name": "Bière blonde",
+             "producer_name": "Brasserie du Vexin", "family_id": "f1"},
+            {"id": "p2", "product_name": "Bière ambrée",
+             "producer_name": "Brasserie du Vexin", "family_id": "f1"},
+            {"id": "p3", "product_name": "Pommes Gala",
+             "producer_name": "Vergers Picards", "family_id": "f2"},
+            {"id": "p4", "product_name": "Jus de pomme",
+             "producer_name": "Vergers Picards", "family_id": "f3"},
+        ],
+        "categories": [
+            {"id": "c1", "name": "Boissons"},
+            {"id": "c2", "name": "Fruits & légumes"},
+        ],
+        "promogroups": [],
+        "families": [
+            {"id": "f1", "name": "Bières", "category_id": "c1"},
+            {"id": "f2", "name": "Fruits", "category_id": "c2"},
+            {"id": "f3", "name": "Jus", "category_id": "c1"},
+        ],
+        "producers": [],
+    }
+
+
+def ids(products):
+    return [p["id"] for p in products]
+
+
+class TestUtilities(unittest.TestCase):
+    def test_normalize(self):
+        self.assertEqual("", s.normalize(None))
+        self.assertEqual("bieres", s.normalize("Bières"))
+        self.assertEqual("creme brulee", s.normalize("CRÈME brûlée"))
+        self.assertEqual("oeufs caecum", s.normalize("Œufs cæcum"))
+        self.assertEqual("oeuvre aeternam", s.normalize("ŒUVRE ÆTERNAM"))
+
+    def test_tokenize(self):
+        self.assertEqual(["fruits", "legumes"],
+                         s.tokenize("Fruits & légumes"))
+
+    def test_trigrams(self):
+        self.assertEqual({"  a", " a "}, s.trigrams("a"))
+
+
+class TestOfferIndex(unittest.TestCase):
+    def setUp(self):
+        self.offer = make_offer()
+        self.index = s.OfferIndex(self.offer)
+
+    def test_len(self):
+        self.assertEqual(4, len(self.index))
+        self.assertIn("p1", self.index)
+        self.assertEqual(0, len(s.OfferIndex()))
+
+    def test_search_empty(self):
+        self.assertEqual([], self.index.search(""))
+        self.assertEqual([], self.index.search("  !"))
+        self.assertEqual([], self.index.search("chocolat"))
+
+    def test_search_accents(self):
+        self.assertEqual(["p2"], ids(self.index.search("AMBREE")))
+
+        offer = make_offer()
+        offer["products"].append({"id": "p5", "product_name": "Œufs bio x6",
+                                  "producer_name": "Ferme du Bœuf"})
+        index = s.OfferIndex(offer)
+        self.assertEqual(["p5"], ids(index.search("oeufs", fuzzy=False)))
+        self.assertEqual(["p5"], ids(index.search("œufs BOEUF")))
+
+    def test_search_prefix(self):
+        self.assertEqual(["p2", "p1"], ids(self.index.search("bi")))
+        self.assertEqual(["p1"], ids(self.index.search("biere blo")))
+
+    def test_search_ranking(self):
+        # exact matches on the product name come first
+        self.assertEqual(["p4", "p3"], ids(self.index.search("pomme")))
+
+    def test_search_other_fields(self):
+        # ties are sorted by name
+        self.assertEqual(["p4", "p3"], ids(self.index.search("picards")))
+        self.assertEqual(["p3"], ids(self.index.search("legumes")))
+        self.assertEqual(["p2", "p1", "p4"],
+                         ids(self.index.search("boissons")))
+
+    def test_search_fuzzy(self):
+        self.assertEqual(["p3", "p4"], ids(self.index.search("pommmes")))
+        self.assertEqual([], self.index.search("pommmes", fuzzy=False))
+
+    def test_search_limit(self):
+        self.assertEqual(["p2"], ids(self.index.search("bi", limit=1)))
+        self.assertEqual([], self.index.search("bi", limit=0))
+        # same order as without limit
+        self.assertEqual(ids(self.index.search("b v", limit=None))[:2],
+                         ids(self.index.search("b v", limit=2)))
+        self.assertEqual(3, len(self.index.search("b v", limit=None)))
+
+    def test_update(self):
+        offer = make_offer()
+        del offer["products"][0]
+        offer["products"][0]["product_name"] = "IPA"
+        offer["products"].append({"id": "p5", "product_name": "Cidre",
+                                  "producer_name": "Vergers Picards",
+                                  "family_id": "f3"})
+        self.index.update(offer)
+
+        self.assertEqual(4, len(self.index))
+        self.assertNotIn("p1", self.index)
+        self.assertEqual([], self.index.search("blonde"))
+        self.assertEqual([], self.index.search("ambree"))
+        self.assertEqual(["p2"], ids(self.index.search("ipa")))
+        self.assertEqual(["p5"], ids(self.index.search("cidre")))
+        self.assertNotIn("blonde", self.index._postings)
+        self.assertNotIn("ambree", self.index._tokens)
+
+    def test_update_family(self):
+        offer = make_offer()
+        offer["families"][0]["name"] = "Bières artisanales"
+        self.index.update(offer)
+        self.assertEqual(["p2", "p1"], ids(self.index.search("artisanales")))
+
+    def test_update_unchanged(self):
+        offer = make_offer()
+        offer["products"][0]["consumer_price"] = 250
+        self.index.update(offer)
+        self.assertEqual(250, self.index.search("blonde")[0]["consumer_price"])
+
+    def test_offer_dicts(self):
+        offer = make_offer()
+        for key, items in offer.items():
+            offer[key] = {item["id"]: item for item in items}
+        index = s.OfferIndex(offer)
+        self.assertEqual(["p3"], ids(index.search("fruits")))
+
+    def test_threads(self):
+        offers = []
+        for n in (50, 300):
+            offer = make_offer()
+            offer["products"] = [{"id": "p%d" % i,
+                                  "product_name": "Produit %d" % i,
+                                  "family_id": "f1"}
+                                 for i in range(n)]
+            offers.append(offer)
+
+        errors = []
+
+        def run(i):
+            try:
+                for j in range(20):
+                    self.index.update(offers[(i + j) % 2])
+                    self.index.search("produit 2")
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([], errors)
+
+
+class TestStoreIndex(unittest.TestCase):
+    def setUp(self):
+        self.k = k.UnauthenticatedKbg()
+
+    def test_get_store_index(self):
+        with responses.RequestsMock() as resps:
+            resps.add(responses.GET, k.API_ENDPOINT + "/init",
+                      json=make_offer())
+            index = self.k.get_store_index("XYZ")
+            self.assertIs(index, self.k.get_store_index("XYZ"))
+            self.assertEqual(1, len(resps.calls))
+
+        self.assertEqual(["p3"], ids(index.search("gala")))
+
+        offer = make_offer()
+        offer["products"][2]["product_name"] = "Pommes Golden"
+
+        with responses.RequestsMock() as resps:
+            resps.add(responses.GET, k.API_ENDPOINT + "/init", json=offer)
+            self.k.get_store_offer("XYZ", force=True)
+            self.assertEqual(1, len(resps.calls))
+
+        self.assertEqual([], index.search("gala"))
+        self.assertEqual(["p3"], ids(index.search("golden")))
+
+    def mock_slow_init(self, resps, release):
+        def init(request):
+            release.wait(5)
+            return (200, {}, json.dumps(make_offer()))
+
+        resps.add_callback(responses.GET, k.API_ENDPOINT + "/init",
+                           content_type="application/json", callback=init)
+
+    def test_refresh_other_store(self):
+        with responses.RequestsMock() as resps:
+            resps.add(responses.GET, k.API_ENDPOINT + "/init",
+                      json=make_offer())
+            index = self.k.get_store_index("ABC")
+
+        release = threading.Event()
+        with responses.RequestsMock() as resps:
+            self.mock_slow_init(resps, release)
+            refresh = threading.Thread(
+                    target=self.k.get_store_offer, args=("XYZ",),
+                    kwargs={"force": True})
+            refresh.start()
+            try:
+                # cached stores don't wait for the refresh of another one
+                self.assertIs(index, self.k.get_store_index("ABC"))
+                self.assertEqual(4,
+                        len(self.k.get_store_offer("ABC")["products"]))
+                self.assertTrue(refresh.is_alive())
+            finally:
+                release.set()
+                refresh.join()
+
+    def test_fetch_once(self):
+        release = threading.Event()
+        offers = []
+
+        with responses.RequestsMock() as resps:
+            self.mock_slow_init(resps, release)
+            threads = [threading.Thread(
+                target=lambda: offers.append(self.k.get_store_offer("XYZ")))
+                for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            release.set()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(1, len(resps.calls))
+
+        self.assertEqual(3, len(offers))
+        self.assertIs(offers[0], offers[1])
+        self.assertIs(offers[0], offers[2])
+
+    def test_get_store_index_shared_cache(self):
+        cache = k.OfferCache()
+        kbg1 = k.UnauthenticatedKbg(offer_cache=cache)
+        kbg2 = k.UnauthenticatedKbg(offer_cache=cache)
+
+        with responses.RequestsMock() as resps:
+            resps.add(responses.GET, k.API_ENDPOINT + "/init",
+                      json=make_offer())
+            index = kbg1.get_store_index("XYZ")
+            self.assertIs(index, kbg2.get_store_index("XYZ"))
+            self.assertEqual(1, len(resps.calls))